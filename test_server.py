@@ -1,11 +1,20 @@
-from flask import Flask, jsonify, send_file, request, url_for, render_template_string
+from flask import Flask, jsonify, send_file, request, url_for
 from functools import wraps
+from werkzeug.exceptions import HTTPException
 import os
 from datetime import datetime
 import base64
 
 app = Flask(__name__)
 
+# 基础文件目录，启动时解析一次绝对路径
+BASE_DIR = os.path.abspath('test_files')
+
+# send_file 传入文件路径时，gunicorn/uWSGI 等提供 wsgi.file_wrapper 的服务器会用 sendfile(2) 零拷贝发送，
+# 例如: gunicorn --worker-class sync test_server:app
+# 部署在支持 X-Sendfile 的前端服务器（如 Apache mod_xsendfile、lighttpd）之后时可设置 USE_X_SENDFILE=1，由前端服务器直接发送文件
+app.config['USE_X_SENDFILE'] = os.environ.get('USE_X_SENDFILE') == '1'
+
 # HTML模板
 HTML_TEMPLATE = '''
 <!DOCTYPE html>
@@ -46,6 +55,9 @@ HTML_TEMPLATE = '''
 </html>
 '''
 
+# 模板只编译一次，避免每次请求重新解析
+LIST_TEMPLATE = app.jinja_env.from_string(HTML_TEMPLATE)
+
 # 测试用户凭据
 VALID_CREDENTIALS = {
     'test': 'password'
@@ -75,24 +87,27 @@ def requires_auth(f):
     return decorated
 
 
+SIZE_UNITS = ('B', 'KB', 'MB', 'GB', 'TB')
+SIZE_DIVISORS = (1, 1024, 1024 ** 2, 1024 ** 3, 1024 ** 4)
+
+
 def format_size(size_in_bytes):
     """格式化文件大小"""
-    if size_in_bytes < 1024:
+    # 用 bit_length 直接算出单位下标，代替逐级比较
+    index = min((size_in_bytes.bit_length() - 1) // 10, 4) if size_in_bytes > 0 else 0
+    if index == 0:
         return f"{size_in_bytes} B"
-    elif size_in_bytes < 1024 * 1024:
-        return f"{size_in_bytes/1024:.1f} KB"
-    else:
-        return f"{size_in_bytes/(1024*1024):.1f} MB"
+    return f"{size_in_bytes/SIZE_DIVISORS[index]:.1f} {SIZE_UNITS[index]}"
 
 
-def get_file_info(base_path, current_path, name):
+def get_file_info(base_path, entry):
     """获取文件信息"""
-    full_path = os.path.join(current_path, name)
-    stats = os.stat(full_path)
-    is_dir = os.path.isdir(full_path)
+    # DirEntry 会缓存 stat 结果，避免对同一文件重复调用 stat
+    stats = entry.stat()
+    is_dir = entry.is_dir()
     
     # 计算相对路径
-    rel_path = os.path.relpath(full_path, base_path)
+    rel_path = os.path.relpath(entry.path, base_path)
     
     # 构建URL时，确保使用当前请求的URL作为基础
     if is_dir:
@@ -101,7 +116,7 @@ def get_file_info(base_path, current_path, name):
         url = f'{request.url_root}files/{rel_path}'
     
     return {
-        'name': name,
+        'name': entry.name,
         'size': "-" if is_dir else format_size(stats.st_size),
         'modified_date': datetime.fromtimestamp(stats.st_mtime),
         'url': url,
@@ -114,11 +129,10 @@ def get_file_info(base_path, current_path, name):
 @requires_auth
 def list_files(subpath=''):
     """列出目录内容"""
-    base_path = 'test_files'  # 基础文件目录
-    current_path = os.path.join(base_path, subpath) if subpath else base_path
+    current_path = os.path.normpath(os.path.join(BASE_DIR, subpath))
     
     # 安全检查：确保路径在基础目录内
-    if not os.path.abspath(current_path).startswith(os.path.abspath(base_path)):
+    if current_path != BASE_DIR and not current_path.startswith(BASE_DIR + os.sep):
         return 'Invalid path', 403
     
     try:
@@ -136,14 +150,15 @@ def list_files(subpath=''):
             })
         
         # 获取当前目录内容
-        for name in sorted(os.listdir(current_path)):
+        with os.scandir(current_path) as it:
             # 跳过隐藏文件
-            if name.startswith('.'):
-                continue
-            items.append(get_file_info(base_path, current_path, name))
+            entries = [entry for entry in it if not entry.name.startswith('.')]
+        entries.sort(key=lambda entry: entry.name)
+        for entry in entries:
+            items.append(get_file_info(BASE_DIR, entry))
         
         # 返回HTML页面
-        return render_template_string(HTML_TEMPLATE, items=items)
+        return LIST_TEMPLATE.render(items=items)
     except Exception as e:
         return str(e), 500
 
@@ -153,25 +168,30 @@ def list_files(subpath=''):
 def download_file(filepath):
     """下载文件"""
     try:
-        file_path = os.path.join('test_files', filepath)
+        file_path = os.path.normpath(os.path.join(BASE_DIR, filepath))
         # 安全检查：确保文件在允许的目录内
-        if not os.path.abspath(file_path).startswith(os.path.abspath('test_files')):
+        if not file_path.startswith(BASE_DIR + os.sep):
             return '无效的文件路径', 403
-        return send_file(file_path, as_attachment=True)
+        # conditional=True 支持 Range 断点续传以及 ETag/If-Modified-Since 缓存校验
+        return send_file(file_path, as_attachment=True, conditional=True, etag=True,
+                         last_modified=os.path.getmtime(file_path))
+    except HTTPException:
+        # 416 等 HTTP 错误原样返回，客户端据此重新完整下载
+        raise
     except Exception as e:
         return str(e), 404
 
 
 if __name__ == '__main__':
     # 创建测试文件目录
-    os.makedirs('test_files', exist_ok=True)
+    os.makedirs(BASE_DIR, exist_ok=True)
     
     # 创建一些测试文件和目录
     test_structure = {
         'documents': {
             'test.txt': 'This is a test file\nWith multiple lines\nAnd some content',
             'hello.md': '# Hello World\nThis is a markdown file\n## Section 1\nSome content here\n## Section 2\nMore content',
-            'large.txt': 'x' * 1024 * 1024  # 1MB file
+            'large.txt': ('sparse', 1024 * 1024)  # 1MB 稀疏文件
         },
         'images': {
             'small.jpg': b'\xFF\xD8\xFF\xE0' + b'\x00' * 1024,  # 1KB fake JPEG
@@ -194,11 +214,15 @@ if __name__ == '__main__':
             if isinstance(content, dict):
                 os.makedirs(path, exist_ok=True)
                 create_test_files(content, path)
+            elif isinstance(content, tuple) and content[0] == 'sparse':
+                # 只设置文件长度，不实际写入数据
+                with open(path, 'wb') as f:
+                    f.truncate(content[1])
             else:
                 mode = 'wb' if isinstance(content, bytes) else 'w'
                 with open(path, mode) as f:
                     f.write(content)
     
-    create_test_files(test_structure, 'test_files')
+    create_test_files(test_structure, BASE_DIR)
     
     app.run(debug=True, port=5000)
@@ -1,12 +1,27 @@
 import json
 import os
 import base64
+from contextlib import contextmanager
 from typing import Optional, Dict
 
+# Concurrent requests per host shared by listings, prefetches and downloads
+DEFAULT_MAX_CONCURRENCY = 8
+
+
+def make_auth_header(username: str, password: str) -> Dict[str, str]:
+    """Build a Basic Authorization header for the given credentials"""
+    credentials = f"{username}:{password}"
+    auth = base64.b64encode(credentials.encode()).decode()
+    return {'Authorization': f'Basic {auth}'}
+
+
 class ConfigManager:
     def __init__(self):
         self.config_file = "settings.json"
         self.config = self.load_config()
+        self._dirty = False
+        self._batch_depth = 0
+        self._auth_cache = None
 
     def load_config(self) -> Dict:
         """Load configuration from file"""
@@ -19,28 +34,63 @@ class ConfigManager:
         return {}
 
     def save_config(self):
-        """Save configuration to file"""
-        with open(self.config_file, 'w') as f:
+        """Save configuration to file atomically"""
+        tmp_file = self.config_file + ".tmp"
+        with open(tmp_file, 'w') as f:
             json.dump(self.config, f, indent=4)
+        os.replace(tmp_file, self.config_file)
+        self._dirty = False
+
+    def flush(self):
+        """Write configuration to disk if it has unsaved changes"""
+        if self._dirty:
+            self.save_config()
+
+    @contextmanager
+    def batch(self):
+        """Defer writing to disk until the outermost batch exits"""
+        self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            self._batch_depth -= 1
+            if self._batch_depth == 0:
+                self.flush()
+
+    def _mark_dirty(self):
+        """Record a change and write it unless a batch is open"""
+        self._dirty = True
+        if self._batch_depth == 0:
+            self.flush()
 
     def get_auth_header(self) -> Optional[Dict[str, str]]:
         """Get authorization header from saved credentials"""
+        if self._auth_cache is not None:
+            return self._auth_cache
+
         username = self.config.get('username')
         password = self.config.get('password')
-        
+
         if username and password:
-            credentials = f"{username}:{password}"
-            auth = base64.b64encode(credentials.encode()).decode()
-            return {'Authorization': f'Basic {auth}'}
-        return None
+            self._auth_cache = make_auth_header(username, password)
+        return self._auth_cache
 
     def set_credentials(self, username: str, password: str, base_url: str = None):
         """Save credentials and optionally base_url to config"""
         self.config['username'] = username
         self.config['password'] = password
+        self._auth_cache = None
         if base_url:
             self.config['base_url'] = base_url
-        self.save_config()
+        self._mark_dirty()
+
+    def get_max_concurrency(self) -> int:
+        """Get the number of requests allowed at once against one host"""
+        value = self.config.get('max_concurrency', DEFAULT_MAX_CONCURRENCY)
+        # Anything but a positive integer (bool is an int too) falls back to the default
+        if isinstance(value, bool) or not isinstance(value, int) or value < 1:
+            return DEFAULT_MAX_CONCURRENCY
+        return value
 
     def get_base_url(self) -> Optional[str]:
         """Get base URL"""
@@ -49,11 +99,12 @@ class ConfigManager:
     def set_base_url(self, url: str):
         """Save base URL"""
         self.config['base_url'] = url
-        self.save_config()
+        self._mark_dirty()
 
     def clear_credentials(self):
         """Clear saved credentials and base_url"""
         self.config.pop('username', None)
         self.config.pop('password', None)
         self.config.pop('base_url', None)
-        self.save_config() 
\ No newline at end of file
+        self._auth_cache = None
+        self._mark_dirty()
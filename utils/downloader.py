@@ -1,156 +1,346 @@
 import os
+import shutil
 from typing import Optional, Callable, Dict, List, Tuple
 from PySide6.QtCore import QObject, Signal
 import threading
-import queue
-from .network import NetworkManager, FileItem
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from .network import NetworkManager, FileItem, AuthRequiredError
+
+COPY_BUFFER_SIZE = 1024 * 1024
+SMALL_FILE_SIZE = 256 * 1024  # bodies up to this size are written in one go
+PROGRESS_INTERVAL = 0.2  # minimum seconds between progress signals
+_IMG_EXTS = ('.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp', '.svg', '.tiff')
+
+
+def _read_validator(path: str) -> Optional[str]:
+    """Read the If-Range validator saved for a partial download"""
+    try:
+        with open(path) as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+def _write_validator(path: str, response) -> None:
+    """Save the strong ETag, else Last-Modified, a partial download can resume against"""
+    etag = response.headers.get('ETag')
+    validator = etag if etag and not etag.startswith('W/') else response.headers.get('Last-Modified')
+    if validator:
+        with open(path, 'w') as f:
+            f.write(validator)
+    elif os.path.exists(path):
+        os.remove(path)
+
+
+class _ProgressWriter:
+    """File wrapper that reports the running byte count as data is written"""
+
+    def __init__(self, f, callback: Callable[[int], None], downloaded: int = 0):
+        self._f = f
+        self._callback = callback
+        self._downloaded = downloaded
+
+    def write(self, data) -> int:
+        written = self._f.write(data)
+        self._downloaded += len(data)
+        self._callback(self._downloaded)
+        return written
+
+
+class _ProgressAggregator:
+    """Combine byte counts of the active downloads into one throttled progress signal"""
+
+    def __init__(self, emit: Callable[[str, float], None]):
+        self._emit = emit
+        self._lock = threading.Lock()
+        self._files: Dict[str, Tuple[int, int]] = {}  # dest path -> (downloaded, total)
+        self._last_emit = 0.0
+        self._pending: Optional[str] = None  # file of the last report held back
+
+    def report(self, dest_path: str, downloaded: int, total: int):
+        with self._lock:
+            self._files[dest_path] = (downloaded, total)
+            now = time.monotonic()
+            if now - self._last_emit < PROGRESS_INTERVAL:
+                self._pending = dest_path
+                return
+            self._last_emit = now
+            self._pending = None
+            done = sum(d for d, _ in self._files.values())
+            size = sum(t for _, t in self._files.values())
+        percent = min(done * 100 // size, 100) if size else 100
+        self._emit(os.path.basename(dest_path), float(percent))
+
+    def finish(self, dest_path: str):
+        with self._lock:
+            self._files.pop(dest_path, None)
+
+    def flush(self):
+        """Send the report held back by the throttle; called once a batch is complete"""
+        with self._lock:
+            pending, self._pending = self._pending, None
+            self._last_emit = time.monotonic()
+        if pending is not None:
+            self._emit(os.path.basename(pending), 100.0)
+
 
 class DownloadManager(QObject):
     progress_updated = Signal(str, float)  # file_name, progress percentage
     overall_progress_updated = Signal(float)  # overall progress percentage
     download_completed = Signal(str)  # file_name
-    download_error = Signal(str, str)  # file_name, error message
+    download_error = Signal(str, object)  # file_name, exception or error message
     directory_scan_completed = Signal(str, int)  # directory name, total files
     all_downloads_completed = Signal()  # emitted when all downloads are done
 
-    def __init__(self, max_concurrent_downloads: int = 3):
+    def __init__(self, max_concurrent_downloads: int = 3,
+                 network: Optional[NetworkManager] = None):
         super().__init__()
-        self.network = NetworkManager()
-        self._active_downloads: Dict[str, threading.Thread] = {}
-        self._download_queue = queue.Queue()
+        self.network = network if network is not None else NetworkManager()
+        self._active_downloads: Dict[str, Future] = {}
         self._lock = threading.Lock()
         self._max_concurrent_downloads = max_concurrent_downloads
-        self._queue_processor = None
-        self._stop_queue = False
+        self._pool = ThreadPoolExecutor(max_workers=max_concurrent_downloads)
+        # Batches are scanned one after another, off the caller's thread
+        self._scan_pool = ThreadPoolExecutor(max_workers=1)
+        self._ensured_dirs = set()
+        self._dirs_lock = threading.Lock()
+        # Resolved and created once; every task saves below it
+        self._downloads_dir = os.path.abspath("downloads")
+        self._ensure_dir(self._downloads_dir)
+        self._progress = _ProgressAggregator(self.progress_updated.emit)
         self._total_files = 0
         self._completed_files = 0
-        
-        # Start queue processor
-        self._start_queue_processor()
-
-    def _start_queue_processor(self):
-        """Start the queue processor thread"""
-        if self._queue_processor is None:
-            self._stop_queue = False
-            self._queue_processor = threading.Thread(target=self._process_queue)
-            self._queue_processor.daemon = True
-            self._queue_processor.start()
-
-    def _process_queue(self):
-        """Process downloads from the queue"""
-        while not self._stop_queue:
-            try:
-                # Check if we can start new downloads
-                with self._lock:
-                    if len(self._active_downloads) >= self._max_concurrent_downloads:
-                        # Wait a bit before checking again
-                        threading.Event().wait(0.1)
-                        continue
-
-                # Get next download from queue with timeout
-                try:
-                    url, dest_path, skip_images = self._download_queue.get(timeout=1)
-                except queue.Empty:
-                    continue
-
-                # Start the download
-                thread = threading.Thread(
-                    target=self._download_worker,
-                    args=(url, dest_path, skip_images)
-                )
-                with self._lock:
-                    self._active_downloads[url] = thread
-                thread.start()
-
-            except Exception:
-                # Log error but keep processing
-                continue
+        self._last_overall_percent = -1
+        self._last_overall_emit = 0.0
+
+    def _submit_download(self, url: str, dest_path: str, skip_images: bool):
+        """Hand a download to the worker pool"""
+        with self._lock:
+            self._active_downloads[url] = self._pool.submit(
+                self._download_worker, url, dest_path, skip_images)
 
     def _download_worker(self, url: str, dest_path: str, skip_images: bool = False):
         try:
             # Check if we should skip images
             if skip_images and self._is_image(url):
-                with self._lock:
-                    self._completed_files += 1
-                    progress = (self._completed_files / self._total_files) * 100
-                    self.overall_progress_updated.emit(progress)
+                self._mark_file_done()
                 return
 
             # Create directory if it doesn't exist
-            os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+            self._ensure_dir(os.path.dirname(dest_path))
 
             # Convert .gls to .csv if necessary
             if dest_path.lower().endswith('.gls'):
                 dest_path = dest_path[:-4] + '.csv'
 
-            response = self.network.download_file(url)
-            total_size = int(response.headers.get('content-length', 0))
-            
-            with open(dest_path, 'wb') as f:
-                if total_size == 0:
-                    f.write(response.content)
-                else:
-                    downloaded = 0
-                    for chunk in response.iter_content(chunk_size=8192):
-                        if chunk:
-                            f.write(chunk)
-                            downloaded += len(chunk)
-                            progress = (downloaded / total_size) * 100
-                            self.progress_updated.emit(os.path.basename(dest_path), progress)
+            # Download into a .part file so an interrupted transfer can resume;
+            # the .validator file next to it keeps the ETag/Last-Modified it is from
+            part_path = dest_path + '.part'
+            validator_path = part_path + '.validator'
+            offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+            validator = _read_validator(validator_path) if offset else None
+            if validator is None:
+                # Without a validator the part may be from another version of the file
+                offset = 0
+
+            with self.network.host_slot(url, 'download'), \
+                    self.network.download_file(url, offset=offset,
+                                               if_range=validator) as response:
+                if response.status_code != 206:
+                    # Full body: either a fresh download or the file changed
+                    offset = 0
+                    _write_validator(validator_path, response)
+                total_size = int(response.headers.get('content-length', 0))
+                # Bodies are read from the connection directly, never via
+                # response.content, which joins many small chunks into a new buffer
+                response.raw.decode_content = True
+
+                with open(part_path, 'r+b' if offset else 'wb') as f:
+                    f.seek(offset)
+                    try:
+                        if total_size == 0:
+                            # Length unknown; stream it without progress
+                            shutil.copyfileobj(response.raw, f, COPY_BUFFER_SIZE)
+                        elif total_size <= SMALL_FILE_SIZE:
+                            # Small bodies arrive in one read; skip the streaming copy
+                            f.write(response.raw.read())
+                            self._progress.report(dest_path, total_size, total_size)
+                        else:
+                            total_size += offset
 
+                            # Reserve the full extent up front where the platform supports it
+                            try:
+                                os.posix_fallocate(f.fileno(), 0, total_size)
+                            except (AttributeError, OSError):
+                                pass
+
+                            writer = _ProgressWriter(
+                                f,
+                                lambda downloaded: self._progress.report(
+                                    dest_path, downloaded, total_size),
+                                downloaded=offset
+                            )
+                            shutil.copyfileobj(response.raw, writer, COPY_BUFFER_SIZE)
+                    finally:
+                        # Drop any preallocated tail the body did not fill, also on
+                        # failure, so the part's size is where a resume starts
+                        f.truncate()
+
+            os.replace(part_path, dest_path)
+            if os.path.exists(validator_path):
+                os.remove(validator_path)
             self.download_completed.emit(os.path.basename(dest_path))
-            
-            with self._lock:
-                self._completed_files += 1
-                progress = (self._completed_files / self._total_files) * 100
-                self.overall_progress_updated.emit(progress)
-                
-                # Check if all downloads are completed
-                if self._completed_files == self._total_files:
-                    self.all_downloads_completed.emit()
+            self._mark_file_done()
 
         except Exception as e:
-            self.download_error.emit(os.path.basename(dest_path), str(e))
+            self.download_error.emit(os.path.basename(dest_path), e)
+            # A failed file still counts towards the batch total
+            self._mark_file_done()
         finally:
+            self._progress.finish(dest_path)
             with self._lock:
                 self._active_downloads.pop(url, None)
 
+    def _ensure_dir(self, path: str):
+        """Create a directory once, skipping paths already ensured in this session"""
+        with self._dirs_lock:
+            if path not in self._ensured_dirs:
+                os.makedirs(path, exist_ok=True)
+                self._ensured_dirs.add(path)
+
+    def _mark_file_done(self):
+        """Count a finished file and report throttled overall progress"""
+        with self._lock:
+            self._completed_files += 1
+            finished = self._completed_files == self._total_files
+            percent = int(self._completed_files * 100 / self._total_files)
+            now = time.monotonic()
+            if finished or (percent != self._last_overall_percent and
+                            now - self._last_overall_emit >= PROGRESS_INTERVAL):
+                self._last_overall_percent = percent
+                self._last_overall_emit = now
+                self.overall_progress_updated.emit(float(percent))
+
+            # Check if all downloads are completed
+            if finished:
+                # The batch's last file reaches 100% even if the throttle held it back
+                self._progress.flush()
+                self.all_downloads_completed.emit()
+
     def start_download_task(self, url: str, skip_images: bool = False):
         """Start a new download task, handling both single files and directories"""
         try:
-            # Determine if it's a directory or single file
-            is_directory = url.endswith('/')
-            
-            # Create base download directory
-            base_dir = "downloads"
-            if is_directory:
-                base_dir = os.path.join(base_dir, url.rstrip('/').split('/')[-1])
-            
-            os.makedirs(base_dir, exist_ok=True)
-            
-            # Get files to download
-            files = self.network.get_all_downloadable_files(url)
-            if not files:
+            jobs = self._collect_download_jobs(url)
+            if not jobs:
                 self.download_error.emit("", "No files to download")
                 return
-                
+
             # Start the batch download
-            self.start_batch_download(files, base_dir, skip_images)
+            self._queue_downloads(jobs, skip_images)
             
         except Exception as e:
-            self.download_error.emit("", str(e))
+            self.download_error.emit("", e)
 
-    def start_batch_download(self, files: List[FileItem], base_dir: str, skip_images: bool = False):
-        """Start downloading a batch of files"""
-        with self._lock:
-            self._total_files = len(files)
-            self._completed_files = 0
-            
+    def start_download_tasks(self, urls: List[str], skip_images: bool = False):
+        """
+        Download several files and directories as one batch
+        Scanning happens in the background; overall progress covers the whole batch.
+        """
+        self._scan_pool.submit(self._run_download_tasks, list(urls), skip_images)
+
+    def _run_download_tasks(self, urls: List[str], skip_images: bool):
+        jobs = []
+        auth_failed = False
+        for url in urls:
+            try:
+                jobs.extend(self._collect_download_jobs(url))
+            except AuthRequiredError as e:
+                # The remaining URLs would fail the same way; ask for credentials
+                # once and still download what earlier URLs found
+                self.download_error.emit(url.rstrip('/').rsplit('/', 1)[-1], e)
+                auth_failed = True
+                break
+            except Exception as e:
+                self.download_error.emit(url.rstrip('/').rsplit('/', 1)[-1], e)
+
+        if jobs:
+            self._queue_downloads(jobs, skip_images)
+        elif not auth_failed:
+            self.download_error.emit("", "No files to download")
+
+    def _collect_download_jobs(self, url: str) -> List[Tuple[str, str]]:
+        """List the (url, destination path) pairs a download of url consists of"""
+        # Determine if it's a directory or single file
+        is_directory = url.endswith('/')
+
+        # Create base download directory
+        base_dir = self._downloads_dir
+        if is_directory:
+            name = url.rstrip('/').split('/')[-1]
+            if name not in ('', '.', '..'):
+                base_dir = os.path.join(base_dir, name)
+            self._ensure_dir(base_dir)
+
+        # Get files to download
+        files = self.network.get_all_downloadable_files(url)
+
+        # Files under the listed URL keep their path relative to it
+        prefix = url if is_directory else url.rsplit('/', 1)[0] + '/'
+        jobs = self._build_jobs(files, base_dir, prefix)
+        if is_directory and jobs:
+            self.directory_scan_completed.emit(os.path.basename(base_dir), len(jobs))
+        return jobs
+
+    def start_batch_download(self, files: List[FileItem], base_dir: str,
+                             skip_images: bool = False, prefix: Optional[str] = None):
+        """
+        Start downloading a batch of files
+        prefix: URL the files were listed from; their paths below it are kept
+        """
+        self._queue_downloads(self._build_jobs(files, base_dir, prefix), skip_images)
+
+    def _build_jobs(self, files: List[FileItem], base_dir: str,
+                    prefix: Optional[str]) -> List[Tuple[str, str]]:
+        """Pair files with their destination, leaving out any that would escape base_dir"""
+        jobs = []
         for file in files:
-            # For single files or files in directory
+            dest_path = self._dest_path(file, base_dir, prefix)
+            if dest_path is None:
+                print(f"Skipping {file.url}: destination is outside {base_dir}")
+                continue
+            jobs.append((file.url, dest_path))
+        return jobs
+
+    def _dest_path(self, file: FileItem, base_dir: str,
+                   prefix: Optional[str]) -> Optional[str]:
+        """Local path for a listed file, or None if it would land outside base_dir"""
+        # For single files or files in directory
+        if prefix and file.url.startswith(prefix):
+            file_path = file.url[len(prefix):]
+        else:
             file_path = self._get_relative_path(file.url, base_dir)
-            dest_path = os.path.join(base_dir, file_path)
-            self._download_queue.put((file.url, dest_path, skip_images))
+
+        # The path comes from the server; never let it climb out of base_dir
+        base_dir = os.path.abspath(base_dir)
+        dest_path = os.path.normpath(os.path.join(base_dir, file_path))
+        if not dest_path.startswith(base_dir + os.sep):
+            return None
+        return dest_path
+
+    def _queue_downloads(self, jobs: List[Tuple[str, str]], skip_images: bool):
+        """Add downloads to the running batch and hand them to the worker pool"""
+        with self._lock:
+            if self._completed_files >= self._total_files:
+                # Nothing in flight; start a fresh overall count
+                self._total_files = 0
+                self._completed_files = 0
+                self._last_overall_percent = -1
+                self._last_overall_emit = 0.0
+            self._total_files += len(jobs)
+
+        for url, dest_path in jobs:
+            self._submit_download(url, dest_path, skip_images)
 
     def _get_relative_path(self, url: str, base_dir: str) -> str:
         """Get the relative path for a file based on its URL and base directory"""
@@ -179,7 +369,7 @@ class DownloadManager(QObject):
             for file in files:
                 if not file.is_directory:
                     dest_path = os.path.join(base_path, file.name)
-                    self._download_queue.put((file.url, dest_path, skip_images))
+                    self._submit_download(file.url, dest_path, skip_images)
                     file_count += 1
             
             # Emit signal with total file count
@@ -190,20 +380,19 @@ class DownloadManager(QObject):
 
     def _is_image(self, url: str) -> bool:
         """Check if URL points to an image file"""
-        image_extensions = ('.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp')
-        return url.lower().endswith(image_extensions)
+        return url.lower().endswith(_IMG_EXTS)
 
     def cancel_download(self, url: str):
         """Cancel an active download"""
         with self._lock:
-            if url in self._active_downloads:
-                del self._active_downloads[url]
+            future = self._active_downloads.pop(url, None)
+        # A job cancelled before it started never reaches its worker, so count it here
+        if future and future.cancel():
+            self._mark_file_done()
 
     def stop(self):
         """Stop the download manager and clean up"""
-        self._stop_queue = True
         with self._lock:
             self._active_downloads.clear()
-        if self._queue_processor:
-            self._queue_processor.join(timeout=1)
-            self._queue_processor = None 
\ No newline at end of file
+        self._scan_pool.shutdown(wait=False, cancel_futures=True)
+        self._pool.shutdown(wait=False, cancel_futures=True)
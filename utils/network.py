@@ -1,142 +1,475 @@
 import requests
-from bs4 import BeautifulSoup
-from urllib.parse import urljoin
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from urllib.parse import urljoin, urlsplit
 import urllib3
-from typing import List, Dict, Optional
-from dataclasses import dataclass
+from typing import Callable, Iterator, List, Dict, Optional, Tuple
+from dataclasses import dataclass, replace
+from collections import OrderedDict
+from contextlib import contextmanager
 from datetime import datetime
-from .config import ConfigManager
+from .config import ConfigManager, make_auth_header
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 import os
+import re
+import threading
+import time
+from lxml import etree
+
+# selectolax is the primary HTML parser; lxml is used where it is not installed
+try:
+    from selectolax.lexbor import LexborHTMLParser
+except ImportError:
+    LexborHTMLParser = None
+
+# Bytes read from the socket per feed into the streaming lxml parser
+LISTING_CHUNK_SIZE = 64 * 1024
+
+# Listing entries handed to the caller at a time by iter_directory
+LISTING_BATCH_SIZE = 64
+
+# Parsed listings kept per URL, and how long they are used without revalidation
+LISTING_CACHE_SIZE = 256
+LISTING_CACHE_TTL = 60.0
 
 # Disable InsecureRequestWarning
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
+# (href, title, size, date) of one row in the listing table
+ListingRow = Tuple[str, Optional[str], str, str]
+
+
+def _parse_rows_selectolax(html: str) -> List[ListingRow]:
+    rows = []
+    for row in LexborHTMLParser(html).css('table#list tbody tr'):
+        # One cell walk per row; the link cell comes first (td.link, td.size, td.date)
+        columns = row.css('td')
+        if not columns or 'link' not in (columns[0].attributes.get('class') or ''):
+            continue
+        link_tag = columns[0].css_first('a')
+        if link_tag is None or not link_tag.attributes.get('href'):
+            continue
+        rows.append((
+            link_tag.attributes['href'],
+            link_tag.attributes.get('title'),
+            columns[1].text(strip=True) if len(columns) > 1 else '',
+            columns[2].text(strip=True) if len(columns) > 2 else ''
+        ))
+    return rows
+
+
+def _iter_rows_lxml(response: requests.Response) -> Iterator[ListingRow]:
+    """Yield rows while the body is still streaming in, dropping each row once read"""
+    rows = []
+    # Feed undecoded bytes; only pin the charset when the server declared one
+    content_type = response.headers.get('content-type', '').lower()
+    encoding = response.encoding if 'charset=' in content_type else None
+    parser = etree.HTMLPullParser(events=('end',), tag='tr', encoding=encoding)
+
+    def read_rows():
+        for _, element in parser.read_events():
+            body = element.getparent()
+            if body is None:
+                continue
+            table = body.getparent()
+            if body.tag == 'tbody' and table is not None and table.get('id') == 'list':
+                columns = element.findall('td')
+                link_tag = next((column.find('a') for column in columns
+                                 if 'link' in (column.get('class') or '').split()), None)
+                if link_tag is not None and link_tag.get('href'):
+                    rows.append((
+                        link_tag.get('href'),
+                        link_tag.get('title'),
+                        ''.join(columns[1].itertext()).strip() if len(columns) > 1 else '',
+                        ''.join(columns[2].itertext()).strip() if len(columns) > 2 else ''
+                    ))
+            # Free the parsed row and any finished siblings before it
+            element.clear()
+            while element.getprevious() is not None:
+                del body[0]
+
+    raw = response.raw
+    raw.decode_content = True
+    for chunk in iter(lambda: raw.read(LISTING_CHUNK_SIZE), b''):
+        parser.feed(chunk)
+        read_rows()
+        yield from rows
+        rows.clear()
+    parser.close()
+    read_rows()
+    yield from rows
+
+
+_SIZE_PATTERN = re.compile(r'([\d.]+)\s*([KMGTP]?)(?:i?B)?', re.IGNORECASE)
+_SIZE_UNITS = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3, 'T': 1024 ** 4, 'P': 1024 ** 5}
+
+
+def _parse_size(size: str) -> int:
+    """Convert a listing size such as '1234', '1.2K' or '3.0 MB' to bytes, -1 if unknown"""
+    match = _SIZE_PATTERN.fullmatch(size.strip())
+    if not match:
+        return -1
+    try:
+        return int(float(match.group(1)) * _SIZE_UNITS[match.group(2).upper()])
+    except ValueError:
+        return -1
+
+
+_MONTHS = {name: number for number, name in enumerate(
+    ('jan', 'feb', 'mar', 'apr', 'may', 'jun',
+     'jul', 'aug', 'sep', 'oct', 'nov', 'dec'), start=1)}
+
+
+def _parse_date(date_str: str) -> datetime:
+    """Parse a 'YYYY-Mon-DD HH:MM' or 'YYYY-MM-DD HH:MM' timestamp by slicing"""
+    if (len(date_str) == 17 and date_str[4] == '-' and date_str[8] == '-'
+            and date_str[11] == ' ' and date_str[14] == ':'):
+        month = _MONTHS.get(date_str[5:8].lower())
+        if month is not None:
+            return datetime(int(date_str[0:4]), month, int(date_str[9:11]),
+                            int(date_str[12:14]), int(date_str[15:17]))
+    elif (len(date_str) == 16 and date_str[4] == '-' and date_str[7] == '-'
+            and date_str[10] == ' ' and date_str[13] == ':'):
+        return datetime(int(date_str[0:4]), int(date_str[5:7]), int(date_str[8:10]),
+                        int(date_str[11:13]), int(date_str[14:16]))
+    raise ValueError(f"Unrecognized date: {date_str!r}")
+
+
+def _join_link(base_url: str, link: str) -> str:
+    """Resolve an href against a directory URL ending in '/'"""
+    # Plain relative names are just appended; anything with a scheme, an absolute
+    # path, a '.' or '..' segment anywhere, a query or a fragment goes through urljoin
+    if (link.startswith(('/', '?', '#')) or ':' in link.split('/', 1)[0]
+            or any(segment in ('.', '..') for segment in link.split('/'))):
+        return urljoin(base_url, link)
+    return base_url + link
+
+
+def _iter_listing_rows(response: requests.Response) -> Iterator[ListingRow]:
+    """Extract the rows of a directory listing"""
+    if LexborHTMLParser is not None:
+        return iter(_parse_rows_selectolax(response.text))
+    return _iter_rows_lxml(response)
+
+
+def _batches(items: List, size: int) -> Iterator[List]:
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class AuthRequiredError(requests.HTTPError):
+    """The server rejected the request for missing or wrong credentials (HTTP 401)"""
+
+
+def _raise_for_status(response: requests.Response):
+    """Like response.raise_for_status, but 401 raises AuthRequiredError"""
+    if response.status_code == 401:
+        raise AuthRequiredError(f"401 Unauthorized for url: {response.url}", response=response)
+    response.raise_for_status()
+
+
 @dataclass
 class FileItem:
+    __slots__ = ('name', 'is_directory', 'size', 'modified_date', 'url', 'size_bytes')
+
     name: str
     is_directory: bool
     size: str
     modified_date: datetime
     url: str
+    size_bytes: int  # parsed from size, -1 when unknown
+
+
+@dataclass
+class _CachedListing:
+    items: List[FileItem]
+    fetched_at: float
+    etag: Optional[str]
+    last_modified: Optional[str]
+
 
 class NetworkManager:
-    def __init__(self):
-        self.config = ConfigManager()
+    def __init__(self, max_connections: Optional[int] = None,
+                 config: Optional[ConfigManager] = None):
+        self.config = config if config is not None else ConfigManager()
         self.session = requests.Session()
         self.session.verify = False
+
+        # Requests per host allowed at once, separately for listings and downloads
+        self.max_concurrency = self.config.get_max_concurrency()
+        if max_connections is None:
+            max_connections = 2 * self.max_concurrency
+
+        # Keep enough pooled keep-alive connections for every concurrent request;
+        # pool_connections is the number of per-host pools, pool_maxsize their size
+        adapter = HTTPAdapter(
+            pool_connections=16,
+            pool_maxsize=max_connections,
+            max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[502, 503, 504])
+        )
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        # LRU of parsed listings; FileItems in it are shared and must not be mutated
+        self._listing_cache: OrderedDict[str, _CachedListing] = OrderedDict()
+        self._cache_lock = threading.Lock()
+        # Bumped with every credential change; listings started before it are not cached
+        self._auth_generation = 0
+        self._auth_header: Optional[Dict[str, str]] = None
         self._update_auth()
 
+        # Per-host concurrency budgets keyed by (purpose, host), see host_slot
+        self._host_slots: Dict[Tuple[str, str], threading.BoundedSemaphore] = {}
+        self._host_slots_lock = threading.Lock()
+
+    @property
+    def scan_workers(self) -> int:
+        """Threads for a recursive walk; one listing slot stays free for navigation"""
+        return max(1, self.max_concurrency - 1)
+
+    @contextmanager
+    def host_slot(self, url: str, purpose: str = 'listing'):
+        """
+        Hold one of the request slots for the host of url, waiting if all are taken
+        purpose: 'listing' or 'download'; each has its own budget of max_concurrency
+        slots, so a long scan never holds up downloads and the other way round
+        """
+        key = (purpose, urlsplit(url).netloc)
+        with self._host_slots_lock:
+            slot = self._host_slots.get(key)
+            if slot is None:
+                slot = self._host_slots[key] = threading.BoundedSemaphore(self.max_concurrency)
+        with slot:
+            yield
+
     def _update_auth(self):
         """Update session headers with current auth credentials"""
-        headers = self.config.get_auth_header()
+        self._apply_auth_header(self.config.get_auth_header())
+
+    def _apply_auth_header(self, headers: Optional[Dict[str, str]]):
+        """Install an Authorization header on the session if it changed"""
+        if headers == self._auth_header:
+            return
+        self._auth_header = headers
+
+        # Listings fetched with other credentials must not be served again
+        with self._cache_lock:
+            self._auth_generation += 1
+            self._listing_cache.clear()
+
         if headers:
             self.session.headers.update(headers)
         else:
             # Remove auth header if no credentials
             self.session.headers.pop('Authorization', None)
 
+    def set_session_credentials(self, username: str, password: str):
+        """Use credentials for this session only, without saving them"""
+        self._apply_auth_header(make_auth_header(username, password))
+
     def set_credentials(self, username: str, password: str, base_url: str):
         """Set new credentials and update session"""
         self.config.set_credentials(username, password, base_url)
         self._update_auth()
 
+    def clear_credentials(self):
+        """Forget saved and session-only credentials and drop the auth header"""
+        self.config.clear_credentials()
+        self._update_auth()
+
+    def invalidate_listing(self, url: str):
+        """Drop the cached listing of url so the next request fetches it again"""
+        if not url.endswith('/'):
+            url += '/'
+        with self._cache_lock:
+            self._listing_cache.pop(url, None)
+
     def list_directory(self, url: str) -> List[FileItem]:
-        """List contents of a directory"""
+        """
+        List contents of a directory
+        Listings are cached per URL. Within LISTING_CACHE_TTL they are returned
+        without a request; after that they are revalidated with ETag/Last-Modified.
+        """
+        return [item for batch in self.iter_directory(url) for item in batch]
+
+    def iter_directory(self, url: str,
+                       batch_size: int = LISTING_BATCH_SIZE) -> Iterator[List[FileItem]]:
+        """
+        List contents of a directory in batches of up to batch_size items
+        Batches are yielded as rows are parsed, so the first ones are available
+        before the whole listing has arrived. Caching is as for list_directory;
+        a listing is only cached once it has been read to the end.
+        """
         if not url.endswith('/'):
             url += '/'
+
+        with self._cache_lock:
+            generation = self._auth_generation
+            cached = self._listing_cache.get(url)
+            if cached:
+                self._listing_cache.move_to_end(url)
+        if cached and time.monotonic() - cached.fetched_at < LISTING_CACHE_TTL:
+            yield from _batches(cached.items, batch_size)
+            return
+
+        headers = {}
+        if cached and cached.etag:
+            headers['If-None-Match'] = cached.etag
+        if cached and cached.last_modified:
+            headers['If-Modified-Since'] = cached.last_modified
             
-        response = self.session.get(url)
-        response.raise_for_status()
-        
-        soup = BeautifulSoup(response.text, 'html.parser')
-        file_list = soup.find('table', id='list').find('tbody').find_all('tr')
-        
         items = []
-        for file in file_list:
-            link_tag = file.find('td', class_='link').find('a')
-            if not link_tag:
-                continue
-                
-            link = link_tag['href']
-            
-            # Handle parent directory specially
-            if link == "../":
-                name = ".."
-                is_directory = True
-                size = ""
-                modified_date = datetime.now()
-                file_url = urljoin(url, link)
-                items.append(FileItem(
-                    name=name,
-                    is_directory=is_directory,
-                    size=size,
-                    modified_date=modified_date,
-                    url=file_url
-                ))
-                continue
-                
-            name = link_tag.get('title', link)
-            is_directory = link.endswith('/')
-            
-            # Get size and date from other columns
-            columns = file.find_all('td')
-            size = columns[1].text.strip() if len(columns) > 1 else ''
-            date_str = columns[2].text.strip() if len(columns) > 2 else ''
-            
-            try:
-                modified_date = datetime.strptime(date_str, '%Y-%b-%d %H:%M')
-            except:
-                try:
-                    # Try alternate format if first one fails
-                    modified_date = datetime.strptime(date_str, '%Y-%m-%d %H:%M')
-                except:
-                    modified_date = datetime.now()
-                
-            file_url = urljoin(url, link)
+        with self.host_slot(url), \
+                self.session.get(url, stream=True, headers=headers) as response:
+            if cached and response.status_code == 304:
+                with self._cache_lock:
+                    cached.fetched_at = time.monotonic()
+                yield from _batches(cached.items, batch_size)
+                return
+            _raise_for_status(response)
+            etag = response.headers.get('ETag')
+            last_modified = response.headers.get('Last-Modified')
+
+            batch_start = 0
+            for row in _iter_listing_rows(response):
+                items.append(self._make_item(url, row))
+                if len(items) - batch_start >= batch_size:
+                    yield items[batch_start:]
+                    batch_start = len(items)
+            if len(items) > batch_start:
+                yield items[batch_start:]
+
+        with self._cache_lock:
+            if generation != self._auth_generation:
+                # Credentials changed while this listing was in flight
+                return
+            self._listing_cache[url] = _CachedListing(
+                items, time.monotonic(), etag, last_modified)
+            self._listing_cache.move_to_end(url)
+            if len(self._listing_cache) > LISTING_CACHE_SIZE:
+                self._listing_cache.popitem(last=False)
+
+    def _make_item(self, url: str, row: ListingRow) -> FileItem:
+        """Build the FileItem for one listing row of the directory at url"""
+        link, title, size, date_str = row
+        # Handle parent directory specially
+        if link == "../":
+            return FileItem(
+                name="..",
+                is_directory=True,
+                size="",
+                modified_date=datetime.now(),
+                url=_join_link(url, link),
+                size_bytes=-1
+            )
             
-            items.append(FileItem(
-                name=name,
-                is_directory=is_directory,
-                size=size,
-                modified_date=modified_date,
-                url=file_url
-            ))
+        name = title or link
+        is_directory = link.endswith('/')
+        
+        try:
+            modified_date = _parse_date(date_str)
+        except ValueError:
+            modified_date = datetime.now()
             
-        return items
+        file_url = _join_link(url, link)
+        
+        return FileItem(
+            name=name,
+            is_directory=is_directory,
+            size=size,
+            modified_date=modified_date,
+            url=file_url,
+            size_bytes=_parse_size(size)
+        )
 
-    def list_directory_recursive(self, url: str, base_path: str = "") -> List[FileItem]:
+    def _walk_files(self, url: str, base_path: str = "", max_workers: Optional[int] = None,
+                    on_error: Optional[Callable[[str, Exception], None]] = None
+                    ) -> List[Tuple[str, FileItem]]:
+        """
+        List every file below url as (relative directory, item) pairs
+        Sibling directories are fetched concurrently by up to max_workers threads
+        (scan_workers by default).
+        Listing errors are raised unless on_error is given, in which case it is
+        called with the failing URL and the walk continues. Each directory URL
+        is listed once, so links back up the tree cannot loop.
+        """
+        files = []
+        visited = {url}
+        pool = ThreadPoolExecutor(max_workers=max_workers or self.scan_workers)
+        try:
+            pending = {pool.submit(self.list_directory, url): (url, base_path)}
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    dir_url, dir_path = pending.pop(future)
+                    try:
+                        listing = future.result()
+                    except Exception as e:
+                        if on_error is None:
+                            raise
+                        on_error(dir_url, e)
+                        continue
+
+                    for item in listing:
+                        # Skip parent directory
+                        if item.name == "..":
+                            continue
+
+                        if item.is_directory:
+                            if item.url in visited:
+                                continue
+                            visited.add(item.url)
+                            sub_path = os.path.join(dir_path, item.name).replace('\\', '/')
+                            pending[pool.submit(self.list_directory, item.url)] = (
+                                item.url, sub_path.rstrip('/'))
+                        else:
+                            files.append((dir_path, item))
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+        return files
+
+    def list_directory_recursive(self, url: str, base_path: str = "",
+                                 max_workers: Optional[int] = None) -> List[FileItem]:
         """Recursively list all files in a directory and its subdirectories"""
         items = []
-        for item in self.list_directory(url):
-            # Skip parent directory
-            if item.name == "..":
-                continue
-                
-            # Update item's name to include the relative path
-            item.name = os.path.join(base_path, item.name).replace('\\', '/')
-            
-            if item.is_directory:
-                # Recursively get files from subdirectory
-                subitems = self.list_directory_recursive(
-                    item.url, 
-                    item.name.rstrip('/')
-                )
-                items.extend(subitems)
-            else:
-                items.append(item)
-                
+        for dir_path, item in self._walk_files(url, base_path, max_workers):
+            # Copy with the relative path as name; listed items are shared with the cache
+            items.append(replace(
+                item, name=os.path.join(dir_path, item.name).replace('\\', '/')))
         return items
 
-    def download_file(self, url: str, callback=None) -> requests.Response:
+    def download_file(self, url: str, callback=None, offset: int = 0,
+                      if_range: Optional[str] = None) -> requests.Response:
         """
         Download a file and return the response object
         callback: Optional function to receive download progress updates
+        offset: Resume from this byte; the server answers 206 if it honours the range
+        if_range: ETag or Last-Modified of the partial copy; if the file has changed
+                  since, the server sends the whole file (200) instead of the range
+        Callers should read the body while holding host_slot(url, 'download').
         """
-        response = self.session.get(url, stream=True)
-        response.raise_for_status()
+        # Ask for the bytes as stored so Content-Length and Range offsets
+        # match what ends up on disk and the body can be copied from raw
+        headers = {'Accept-Encoding': 'identity'}
+        if offset:
+            headers['Range'] = f'bytes={offset}-'
+            if if_range:
+                headers['If-Range'] = if_range
+        response = self.session.get(url, stream=True, headers=headers)
+        if offset and response.status_code == 416:
+            # The partial copy does not match the file any more; start over
+            response.close()
+            response = self.session.get(url, stream=True,
+                                        headers={'Accept-Encoding': 'identity'})
+        try:
+            _raise_for_status(response)
+        except requests.HTTPError:
+            response.close()
+            raise
         return response
 
-    def get_all_downloadable_files(self, url: str, base_path: str = "") -> List[FileItem]:
+    def get_all_downloadable_files(self, url: str, base_path: str = "",
+                                   max_workers: Optional[int] = None) -> List[FileItem]:
         """Get all downloadable files recursively from a directory"""
         all_files = []
         try:
@@ -148,23 +481,22 @@ class NetworkManager:
                     is_directory=False,
                     size='0',  # Size will be determined during actual download
                     modified_date=datetime.now(),
-                    url=url
+                    url=url,
+                    size_bytes=-1
                 )]
 
+            def on_error(dir_url: str, e: Exception):
+                # Missing credentials affect every directory; stop and let the caller ask
+                if isinstance(e, AuthRequiredError):
+                    raise e
+                print(f"Error getting files from {dir_url}: {str(e)}")
+
             # If we get here, it's a directory
-            items = self.list_directory(url)
-            for item in items:
-                # Skip parent directory
-                if item.name == "..":
-                    continue
-                    
-                if item.is_directory:
-                    # Recursively get files from subdirectory
-                    subitems = self.get_all_downloadable_files(item.url)
-                    all_files.extend(subitems)
-                else:
-                    all_files.append(item)
-                    
+            all_files = [item for _, item in self._walk_files(
+                url, base_path, max_workers, on_error=on_error)]
+
+        except AuthRequiredError:
+            raise
         except Exception as e:
             print(f"Error getting files from {url}: {str(e)}")
         return all_files 
\ No newline at end of file
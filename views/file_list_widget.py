@@ -1,14 +1,36 @@
 from PySide6.QtWidgets import (QTreeWidget, QTreeWidgetItem, QMenu, 
                                 QAbstractItemView, QHeaderView, QTreeWidgetItemIterator)
-from PySide6.QtCore import Qt, Signal
+from PySide6.QtCore import Qt, Signal, QTimer
 from PySide6.QtGui import QIcon, QAction
 from datetime import datetime
 from typing import Optional, List, Dict
-import os
+from utils.network import FileItem
+
+SIZE_ROLE = Qt.UserRole + 1  # byte count stored on the Size column
+PREFETCH_DELAY_MS = 200  # hover time on a directory row before it is prefetched
+
+
+class _FileTreeItem(QTreeWidgetItem):
+    """Tree row that sorts the Size column by byte count instead of text
+
+    The sort keys live on the Python side and the column is cached by the
+    owning widget, so comparisons during a sort make no calls into Qt.
+    """
+
+    def __init__(self, tree: "FileTreeWidget", sort_keys: tuple):
+        super().__init__()
+        self._tree = tree
+        self._sort_keys = sort_keys
+
+    def __lt__(self, other):
+        column = self._tree.sort_column
+        return self._sort_keys[column] < other._sort_keys[column]
+
 
 class FileTreeWidget(QTreeWidget):
-    download_requested = Signal(str, str, bool)  # url, save_path, skip_images
+    download_requested = Signal(list, bool)  # urls, skip_images
     navigate_requested = Signal(str)  # url
+    prefetch_requested = Signal(str)  # url of a directory the user is likely to open
 
     def __init__(self, parent=None):
         super().__init__(parent)
@@ -30,16 +52,33 @@ class FileTreeWidget(QTreeWidget):
         # Hide URL column
         self.hideColumn(3)
         
-        # Enable sorting
+        # Enable sorting; the column is cached before the view's own handler
+        # re-sorts, which setSortingEnabled(True) always connects after ours
+        self.sort_column = self.header().sortIndicatorSection()
+        self.header().sortIndicatorChanged.connect(self.handle_sort_changed)
         self.setSortingEnabled(True)
         self.header().setSectionResizeMode(0, QHeaderView.Interactive)
         self.header().setSectionResizeMode(1, QHeaderView.Interactive)
         self.header().setSectionResizeMode(2, QHeaderView.Interactive)
         
+        # Theme icons are looked up once and shared by all rows
+        self._folder_icon = QIcon.fromTheme("folder")
+        self._file_icon = QIcon.fromTheme("text-x-generic")
+        
         # Enable checkboxes
         self.setRootIsDecorated(False)
         self.itemClicked.connect(self.handle_item_click)
         self.itemDoubleClicked.connect(self.handle_double_click)
+        
+        # Prefetch directories the cursor rests on
+        self.setMouseTracking(True)
+        self._prefetch_url = ""
+        self._prefetch_timer = QTimer(self)
+        self._prefetch_timer.setSingleShot(True)
+        self._prefetch_timer.setInterval(PREFETCH_DELAY_MS)
+        self._prefetch_timer.timeout.connect(
+            lambda: self.prefetch_requested.emit(self._prefetch_url))
+        self.itemEntered.connect(self.handle_item_entered)
 
     def setup_context_menu(self):
         self.setContextMenuPolicy(Qt.CustomContextMenu)
@@ -64,6 +103,9 @@ class FileTreeWidget(QTreeWidget):
         if items:
             self.context_menu.exec_(self.viewport().mapToGlobal(position))
 
+    def handle_sort_changed(self, column: int, order: Qt.SortOrder):
+        self.sort_column = column
+
     def handle_item_click(self, item: QTreeWidgetItem, column: int):
         # Handle checkbox toggling
         if column == 0:
@@ -75,48 +117,92 @@ class FileTreeWidget(QTreeWidget):
         if item.data(0, Qt.UserRole) == "directory":
             self.navigate_requested.emit(item.text(3))  # Emit URL
 
+    def handle_item_entered(self, item: QTreeWidgetItem, column: int):
+        # Restart the hover delay; only directories are worth prefetching
+        self._prefetch_timer.stop()
+        if item.data(0, Qt.UserRole) == "directory" and item.text(0) != "..":
+            self._prefetch_url = item.text(3)
+            self._prefetch_timer.start()
+
     def handle_download(self, skip_images: bool = False):
         items = self.get_selected_or_checked_items()
-        for item in items:
-            url = item.text(3)
-            # Create save path based on current structure
-            relative_path = os.path.join(
-                os.path.basename(self.current_path), 
-                item.text(0)
-            )
-            self.download_requested.emit(url, relative_path, skip_images)
+        urls = [item.text(3) for item in items if item.text(0) != ".."]
+        if urls:
+            # One request for the whole selection so it is downloaded as a single batch
+            self.download_requested.emit(urls, skip_images)
 
     def get_selected_or_checked_items(self) -> List[QTreeWidgetItem]:
         """Get items that are either selected or checked"""
         items = []
+        # Dedupe by wrapper identity; a list membership test would make this O(N^2)
+        seen = set()
         for item in self.selectedItems():
-            if item not in items:
+            if id(item) not in seen:
+                seen.add(id(item))
                 items.append(item)
         
         iterator = QTreeWidgetItemIterator(self)
         while iterator.value():
             item = iterator.value()
             if (item.checkState(0) == Qt.Checked and 
-                item not in items):
+                id(item) not in seen):
+                seen.add(id(item))
                 items.append(item)
             iterator += 1
             
         return items
 
     def add_file_item(self, name: str, size: str, modified: datetime, 
-                      url: str, is_directory: bool):
-        item = QTreeWidgetItem(self)
+                      url: str, is_directory: bool, size_bytes: int = -1):
+        item = self.create_file_item(name, size, modified, url, is_directory, size_bytes)
+        self.addTopLevelItem(item)
+        return item
+
+    def begin_loading(self):
+        """Hold off sorting while a listing arrives in several batches"""
+        self.setSortingEnabled(False)
+
+    def end_loading(self):
+        """Sort the complete listing once"""
+        self.setSortingEnabled(True)
+
+    def add_file_items(self, items: List[FileItem]):
+        """Add listed items in one insert, without re-sorting or repainting per row"""
+        sorting = self.isSortingEnabled()
+        self.setSortingEnabled(False)
+        self.setUpdatesEnabled(False)
+        try:
+            self.addTopLevelItems([
+                self.create_file_item(
+                    name=item.name,
+                    size=item.size,
+                    modified=item.modified_date,
+                    url=item.url,
+                    is_directory=item.is_directory,
+                    size_bytes=item.size_bytes
+                )
+                for item in items
+            ])
+        finally:
+            self.setUpdatesEnabled(True)
+            self.setSortingEnabled(sorting)
+
+    def create_file_item(self, name: str, size: str, modified: datetime,
+                         url: str, is_directory: bool, size_bytes: int = -1) -> QTreeWidgetItem:
+        """Build a row without inserting it, for bulk insertion with addTopLevelItems"""
+        modified_text = modified.strftime("%Y-%m-%d %H:%M")
+        item = _FileTreeItem(self, (name, size_bytes, modified_text, url))
         item.setText(0, name)
         item.setText(1, size)
-        item.setText(2, modified.strftime("%Y-%m-%d %H:%M"))
+        item.setData(1, SIZE_ROLE, size_bytes)
+        item.setText(2, modified_text)
         item.setText(3, url)
         
         # Set item type
         item.setData(0, Qt.UserRole, "directory" if is_directory else "file")
         
         # Set icon based on type
-        icon = QIcon.fromTheme("folder" if is_directory else "text-x-generic")
-        item.setIcon(0, icon)
+        item.setIcon(0, self._folder_icon if is_directory else self._file_icon)
         
         # Add checkbox
         item.setCheckState(0, Qt.Unchecked)
@@ -125,5 +211,6 @@ class FileTreeWidget(QTreeWidget):
 
     def clear_and_set_path(self, path: str):
         """Clear the view and set new current path"""
+        self._prefetch_timer.stop()
         self.clear()
         self.current_path = path 
\ No newline at end of file
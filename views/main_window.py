@@ -2,25 +2,85 @@ from PySide6.QtWidgets import (QMainWindow, QWidget, QVBoxLayout,
                                 QHBoxLayout, QLineEdit, QPushButton, 
                                 QProgressBar, QLabel, QMessageBox,
                                 QMenuBar, QMenu)
-from PySide6.QtGui import QAction
-from PySide6.QtCore import Qt, Slot
+from PySide6.QtGui import QAction, QKeySequence
+from PySide6.QtCore import Qt, Slot, Signal, QObject, QRunnable, QThreadPool
 import os
 from views.file_list_widget import FileTreeWidget
 from views.login_dialog import LoginDialog
-from utils.network import NetworkManager
+from utils.network import NetworkManager, AuthRequiredError
 from utils.downloader import DownloadManager
 from utils.config import ConfigManager
-import base64
+
+MAX_PREFETCHES = 4
+SHUTDOWN_WAIT_MS = 3000  # how long closing waits for listings still in flight
+
+
+class _ListDirectorySignals(QObject):
+    batch_ready = Signal(int, str, list)  # navigation id, url, list of FileItem
+    finished = Signal(int, str)  # navigation id, url
+    failed = Signal(int, str, object)  # navigation id, url, exception
+
+
+class _ListDirectoryTask(QRunnable):
+    """Fetch a directory listing on the thread pool and report it through signals"""
+
+    def __init__(self, network: NetworkManager, url: str, navigation_id: int,
+                 signals: _ListDirectorySignals):
+        super().__init__()
+        self.network = network
+        self.url = url
+        self.navigation_id = navigation_id
+        self.signals = signals
+
+    def run(self):
+        try:
+            try:
+                # Hand rows over in batches as they are parsed
+                for items in self.network.iter_directory(self.url):
+                    self.signals.batch_ready.emit(self.navigation_id, self.url, items)
+            except Exception as e:
+                self.signals.failed.emit(self.navigation_id, self.url, e)
+            else:
+                self.signals.finished.emit(self.navigation_id, self.url)
+        except RuntimeError:
+            # The window and its signals were deleted while the listing ran (shutdown)
+            pass
+
+
+class _PrefetchTask(QRunnable):
+    """Warm the listing cache for a directory the user is likely to open"""
+
+    def __init__(self, network: NetworkManager, url: str):
+        super().__init__()
+        self.network = network
+        self.url = url
+
+    def run(self):
+        try:
+            self.network.list_directory(self.url)
+        except Exception:
+            # Best effort; a real navigation reports any error
+            pass
+
 
 class MainWindow(QMainWindow):
     def __init__(self):
         super().__init__()
         self.config = ConfigManager()
-        self.network = NetworkManager()
-        self.downloader = DownloadManager()
+        self.network = NetworkManager(config=self.config)
+        self.downloader = DownloadManager(network=self.network)
+        self._listing_signals = _ListDirectorySignals()
+        # At most MAX_PREFETCHES prefetches run at once; extra requests are dropped
+        self._prefetch_pool = QThreadPool(self)
+        self._prefetch_pool.setMaxThreadCount(MAX_PREFETCHES)
         self.setup_ui()
         self.setup_connections()
         self.current_url = ""
+        self._navigation_id = 0
+        # Last values shown for the current file, to skip repeated updates
+        self._last_pct = -1
+        self._last_name = None
+        self._login_dialog_open = False
         
         # Try to restore base URL
         base_url = self.config.get_base_url()
@@ -55,6 +115,14 @@ class MainWindow(QMainWindow):
         # Create status bar with progress
         self.statusBar().showMessage("Ready")
         
+        # Busy indicator while a directory listing loads
+        self.loading_indicator = QProgressBar()
+        self.loading_indicator.setRange(0, 0)
+        self.loading_indicator.setMaximumWidth(100)
+        self.loading_indicator.setTextVisible(False)
+        self.loading_indicator.hide()
+        self.statusBar().addWidget(self.loading_indicator)
+        
         # Create progress bar layout
         progress_layout = QHBoxLayout()
         
@@ -102,6 +170,15 @@ class MainWindow(QMainWindow):
         exit_action = QAction("Exit", self)
         exit_action.triggered.connect(self.close)
         file_menu.addAction(exit_action)
+        
+        # View menu
+        view_menu = menubar.addMenu("View")
+        
+        # Refresh action
+        refresh_action = QAction("Refresh", self)
+        refresh_action.setShortcut(QKeySequence.Refresh)
+        refresh_action.triggered.connect(self.refresh)
+        view_menu.addAction(refresh_action)
 
     def setup_connections(self):
         # Connect address bar
@@ -111,6 +188,12 @@ class MainWindow(QMainWindow):
         # Connect file list signals
         self.file_list.navigate_requested.connect(self.handle_navigation)
         self.file_list.download_requested.connect(self.handle_download)
+        self.file_list.prefetch_requested.connect(self.prefetch_directory)
+
+        # Connect directory listing results from worker threads
+        self._listing_signals.batch_ready.connect(self._add_listing_batch)
+        self._listing_signals.finished.connect(self._finish_listing)
+        self._listing_signals.failed.connect(self._handle_listing_error)
 
         # Connect downloader signals
         self.downloader.progress_updated.connect(self.update_download_progress)
@@ -121,6 +204,16 @@ class MainWindow(QMainWindow):
         self.downloader.all_downloads_completed.connect(self.handle_all_downloads_completed)
 
     def show_login_dialog(self):
+        # Several requests can fail with 401 at once; prompt only once
+        if self._login_dialog_open:
+            return
+        self._login_dialog_open = True
+        try:
+            self._run_login_dialog()
+        finally:
+            self._login_dialog_open = False
+
+    def _run_login_dialog(self):
         dialog = LoginDialog(self)
         
         # Pre-fill credentials and base URL if available
@@ -143,14 +236,11 @@ class MainWindow(QMainWindow):
                     self.address_bar.setText(dialog.base_url)
             else:
                 # Use credentials for this session only
-                self.network.session.headers.update({
-                    'Authorization': f'Basic {base64.b64encode(f"{dialog.username}:{dialog.password}".encode()).decode()}'
-                })
+                self.network.set_session_credentials(dialog.username, dialog.password)
                 self.config.clear_credentials()
 
     def handle_logout(self):
-        self.config.clear_credentials()
-        self.network._update_auth()
+        self.network.clear_credentials()
         self.statusBar().showMessage("Logged out")
 
     @Slot()
@@ -159,57 +249,90 @@ class MainWindow(QMainWindow):
         if url:
             self.handle_navigation(url)
 
+    @Slot(str)
+    def prefetch_directory(self, url: str):
+        """Fetch a directory listing into the cache in the background"""
+        self._prefetch_pool.tryStart(_PrefetchTask(self.network, url))
+
+    @Slot()
+    def refresh(self):
+        """Reload the current directory, bypassing the listing cache"""
+        if self.current_url:
+            self.network.invalidate_listing(self.current_url)
+            self.handle_navigation(self.current_url)
+
     @Slot(str)
     def handle_navigation(self, url: str):
-        try:
-            self.current_url = url
-            self.address_bar.setText(url)
-            self.statusBar().showMessage("Loading...")
-            
-            # Clear current view
-            self.file_list.clear_and_set_path(url)
-            
-            # Load directory contents
-            items = self.network.list_directory(url)
-            
-            # Add items to view
-            for item in items:
-                self.file_list.add_file_item(
-                    name=item.name,
-                    size=item.size,
-                    modified=item.modified_date,
-                    url=item.url,
-                    is_directory=item.is_directory
-                )
-                
-            self.statusBar().showMessage("Ready")
+        self.current_url = url
+        self.address_bar.setText(url)
+        self.statusBar().showMessage("Loading...")
+        self.loading_indicator.show()
+        
+        # Clear current view; rows are sorted once the whole listing is in
+        self.file_list.clear_and_set_path(url)
+        self.file_list.begin_loading()
+        
+        # Load directory contents on a worker thread; results arrive via signals.
+        # The UI stays usable meanwhile, so only the latest navigation is shown.
+        self._navigation_id += 1
+        QThreadPool.globalInstance().start(_ListDirectoryTask(
+            self.network, url, self._navigation_id, self._listing_signals))
+
+    @Slot(int, str, list)
+    def _add_listing_batch(self, navigation_id: int, url: str, items: list):
+        # Ignore results for a directory the user has already navigated away from
+        if navigation_id != self._navigation_id:
+            return
             
-        except Exception as e:
-            self.statusBar().showMessage("Error loading directory")
-            if "401" in str(e):
-                self.show_login_dialog()
-            else:
-                QMessageBox.critical(self, "Error", f"Failed to load directory: {str(e)}")
+        # Add items to view
+        self.file_list.add_file_items(items)
+
+    @Slot(int, str)
+    def _finish_listing(self, navigation_id: int, url: str):
+        if navigation_id != self._navigation_id:
+            return
+        self.file_list.end_loading()
+        self.loading_indicator.hide()
+        self.statusBar().showMessage("Ready")
+
+    @Slot(int, str, object)
+    def _handle_listing_error(self, navigation_id: int, url: str, e: Exception):
+        if navigation_id != self._navigation_id:
+            return
+        self.file_list.end_loading()
+        self.loading_indicator.hide()
+        self.statusBar().showMessage("Error loading directory")
+        if isinstance(e, AuthRequiredError):
+            self.show_login_dialog()
+        else:
+            QMessageBox.critical(self, "Error", f"Failed to load directory: {str(e)}")
 
-    @Slot(str, str, bool)
-    def handle_download(self, url: str, save_path: str, skip_images: bool):
+    @Slot(list, bool)
+    def handle_download(self, urls: list, skip_images: bool):
         try:
             # Show progress bars
             self.file_progress_bar.show()
             self.overall_progress_bar.show()
             self.file_progress_bar.setValue(0)
             self.overall_progress_bar.setValue(0)
+            self._last_pct = -1
+            self._last_name = None
             
-            # Start download
-            self.downloader.start_download_task(url, skip_images)
+            # Scan and download the selection in the background
+            self.downloader.start_download_tasks(urls, skip_images)
             
         except Exception as e:
-            self.handle_download_error(save_path, str(e))
+            self.handle_download_error("", e)
 
     @Slot(str, float)
     def update_download_progress(self, file_name: str, progress: float):
-        self.file_progress_label.setText(f"Current file: {file_name}")
-        self.file_progress_bar.setValue(int(progress))
+        percent = int(progress)
+        if file_name != self._last_name:
+            self._last_name = file_name
+            self.file_progress_label.setText(f"Current file: {file_name}")
+        if percent != self._last_pct:
+            self._last_pct = percent
+            self.file_progress_bar.setValue(percent)
 
     @Slot(float)
     def update_overall_progress(self, progress: float):
@@ -225,12 +348,12 @@ class MainWindow(QMainWindow):
         self.file_progress_bar.hide()
         self.overall_progress_bar.hide()
 
-    @Slot(str, str)
-    def handle_download_error(self, file_name: str, error: str):
+    @Slot(str, object)
+    def handle_download_error(self, file_name: str, error):
         self.file_progress_bar.hide()
         self.overall_progress_bar.hide()
         self.statusBar().showMessage("Download failed")
-        if "401" in error:
+        if isinstance(error, AuthRequiredError):
             self.show_login_dialog()
         else:
             QMessageBox.critical(
@@ -247,4 +370,8 @@ class MainWindow(QMainWindow):
     def closeEvent(self, event):
         """Handle application closing"""
         self.downloader.stop()
+        # Drop results of listings still running and give them a moment to finish
+        self._navigation_id += 1
+        QThreadPool.globalInstance().waitForDone(SHUTDOWN_WAIT_MS)
+        self._prefetch_pool.waitForDone(SHUTDOWN_WAIT_MS)
         super().closeEvent(event) 
\ No newline at end of file